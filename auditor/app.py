@@ -13,14 +13,9 @@ Date: 08/16/2024
 """
 import utils
 import tests
-import introcs
 import sys
 import os.path
-import violations
-
-# Uncomment for the extra credit
-import endorsements
-#import inspections
+import itertools
 
 
 def discover_violations(directory,output):
@@ -56,6 +51,13 @@ def discover_violations(directory,output):
     Parameter output: The CSV file to store the results
     Precondition: output is None or a string that is a valid file name
     """
+    # Imported here so that --test and usage errors do not load the audit modules
+    import violations
+
+    # Uncomment for the extra credit
+    import endorsements
+    #import inspections
+
     header = ['STUDENT','AIRPLANE','INSTRUCTOR','TAKEOFF','LANDING','FILED','AREA','REASON']
     all_violations = []
     filepath = os.path.join(directory, '')
@@ -64,30 +66,22 @@ def discover_violations(directory,output):
     endorsement_list = endorsements.list_endorsement_violations(filepath)
     # inspections_list = inspections.list_inspection_violations(filepath)
 
-    if len(violation_list) > 0:
-        violation_list.insert(0, header)
-        all_violations = all_violations + violation_list
-
-    if len(endorsement_list) > 0:
-       all_violations = all_violations + endorsement_list
-
-    # if len(inspections_list) > 0:
-    #     all_violations = all_violations + inspections_list
+    all_violations.extend(violation_list)
+    all_violations.extend(endorsement_list)
+    # all_violations.extend(inspections_list)
 
-    total_violations = len(all_violations) - 1
+    total_violations = len(all_violations)
 
+    # The header goes in front of the rows as they are written (no combined copy)
     if output != None:
         outfile = os.path.join(directory,output)
-        utils.write_csv(all_violations,outfile)
+        utils.write_csv(itertools.chain([header],all_violations),outfile)
 
-    if total_violations > 0 and total_violations < 2:
-        print(f'{total_violations} violation found.')
-    
-    elif total_violations >= 2:
-        print(f'{total_violations} violations found.')
-    
-    else:
+    if total_violations == 0:
         print('No violations found.')
+    else:
+        plural = '' if total_violations == 1 else 's'
+        print(f'{total_violations} violation{plural} found.')
     
 
 def execute(args):
@@ -118,18 +112,17 @@ def execute(args):
         if args[0] == '--test':
             tests.test_all()
 
-        elif (introcs.startswith_str(args[0], 'KITH-')):
-            discover_violations(args[0])
+        elif args[0].startswith('KITH-'):
+            discover_violations(args[0],None)
 
         else:
             print('Usage: python auditor dataset [output.csv]')    
 
     elif len(args) == 2:
-        if (introcs.startswith_str(args[0], 'KITH-')) and (args[1] != None) and \
-           (introcs.endswith_str(args[1], '.csv') or introcs.endswith_str(args[1], '.CSV')):
+        if args[0].startswith('KITH-') and (args[1] != None) and args[1].lower().endswith('.csv'):
             discover_violations(args[0],args[1])
         
-        elif (introcs.startswith_str(args[0], 'KITH-')) and (args[1] == None):
+        elif args[0].startswith('KITH-') and (args[1] == None):
             discover_violations(args[0],args[1])
         
         else:
@@ -53,12 +53,7 @@ def teaches_multiengine(instructor):
     Parameter instructor: The flight instructor
     Precondition: instructor is a 6-element list of strings representing an instructor
     """
-
-    if instructor[5] == 'Yes':
-        return True
-
-    else:
-        return False
+    return instructor[5] == 'Yes'
 
 
 def teaches_instrument(instructor):
@@ -69,12 +64,7 @@ def teaches_instrument(instructor):
     Parameter instructor: The flight instructor
     Precondition: instructor is a 6-element list of strings representing an instructor
     """
-
-    if instructor[4] == 'Yes':
-        return True
-
-    else:
-        return False
+    return instructor[4] == 'Yes'
 
 
 def is_advanced(plane):
@@ -84,12 +74,7 @@ def is_advanced(plane):
     Parameter plane: The school airplane
     Precondition: plane is a 7-element list of strings representing an airplane
     """
-
-    if plane[3] == 'Yes':
-        return True
-
-    else:
-        return False
+    return plane[3] == 'Yes'
 
 
 def is_multiengine(plane):
@@ -99,12 +84,7 @@ def is_multiengine(plane):
     Parameter plane: The school airplane
     Precondition: plane is a 7-element list of strings representing an airplane
     """
-
-    if plane[4] == 'Yes':
-        return True
-
-    else:
-        return False
+    return plane[4] == 'Yes'
 
 
 def is_ifr_capable(plane):
@@ -117,12 +97,34 @@ def is_ifr_capable(plane):
     Parameter plane: The school airplane
     Precondition: plane is a 7-element list of strings representing an airplane
     """
+    return plane[2] == 'IFR'
 
-    if plane[2] == 'IFR':
-        return True
 
-    else:
-        return False
+def instructor_flags(instructor):
+    """
+    Returns the tuple (cfi, cfii, mei) of bools for this instructor.
+    
+    These say whether the instructor can teach a student on a VFR flight, on an IFR 
+    flight (teaches_instrument), and on a multiengine flight (teaches_multiengine), in
+    that order.  They never change, so the lesson loop computes them once per instructor.
+    
+    Parameter instructor: The flight instructor
+    Precondition: instructor is a utils.Instructor representing an instructor
+    """
+    return (instructor.cfi == 'Yes', instructor.cfii == 'Yes', instructor.mei == 'Yes')
+
+
+def plane_flags(plane):
+    """
+    Returns the tuple (ifr capable, advanced, multiengine) of bools for this plane.
+    
+    These are the results of is_ifr_capable, is_advanced, and is_multiengine, in that
+    order.  They never change, so the lesson loop computes them once per plane.
+    
+    Parameter plane: The school airplane
+    Precondition: plane is a utils.Plane representing an airplane
+    """
+    return (plane.capability == 'IFR', plane.advanced == 'Yes', plane.multiengine == 'Yes')
 
 
 def bad_endorsement(takeoff,student,instructor,plane):
@@ -151,72 +153,56 @@ def bad_endorsement(takeoff,student,instructor,plane):
     """
     assert type(takeoff) == datetime.datetime
 
-    #print('takeoff: ', takeoff,'/ takeoff_type: ', type(takeoff))
-    #print('student: ', student)
-    #print('instructor: ', instructor)
-    #print('plane: ', plane)
-    student_endorsed_multi = False
-    student_endorsed_advance = False
-    instructor_endorsed_multi = False
-    instructor_endorsed_advance = True
-    instructor_teaches_ifr = False
-
-
-    plane_ifr_capable = is_ifr_capable(plane)
-    plane_advanced = is_advanced(plane)
-    plane_multieng = is_multiengine(plane)
-    #print('plane_ifr_capable: ', plane_ifr_capable, '/ plane advanced: ', plane_advanced, \
-    #      '/ plane_multieng: ', plane_multieng)
-
-    student_certified = pilots.get_certification(takeoff,student)
-    student_advanced = pilots.has_advanced_endorsement(takeoff,student)
-    student_multieng = pilots.has_multiengine_endorsement(takeoff,student)
-
-    if plane_multieng == True or plane_advanced == True:
-        if plane_multieng == True and student_multieng == True:
-            student_endorsed_multi = True
-
-        elif plane_multieng == True and student_multieng == False:
-            student_endorsed_multi = False
-
-        if plane_advanced == True and student_advanced == True:
-            student_endorsed_advance = True
-
-        elif plane_advanced == True and student_advanced == False:
-            student_endorsed_advance = False
-
-        if instructor != None:
-            instructor_teaches_ifr = teaches_instrument(instructor)
-            instructor_multieng = teaches_multiengine(instructor)
-        else:
-            instructor_teaches_ifr = False
-            instructor_multieng = False
-
-        if plane_multieng == True and instructor_multieng == False:
-            instructor_endorsed_multi = False
-        elif plane_multieng == True and instructor_multieng == True:
-            instructor_endorsed_multi = True
-        else:
-            instructor_endorsed_multi = False
-
-        #print('std endorsed_multi: ', student_endorsed_multi, ' / std endorsed_advance: ', \
-        #      student_endorsed_advance)
-        #print('inst endorsed_multi: ', instructor_endorsed_multi, ' / inst teaches_ifr: ', \
-        #    instructor_teaches_ifr )
-
-        if ((instructor == None) and (plane_advanced == True) and (plane_multieng == False) and \
-            (student_endorsed_advance == False)) or \
-           ((instructor == None) and (plane_advanced == True) and (plane_multieng == True) and \
-            (student_endorsed_multi == False)) or \
-           ((instructor != None) and (plane_multieng == True) and \
-            (instructor_endorsed_multi == False)): # or \
-            return True
-        else:
-            return False
+    # Do not look up the student for a plane that needs no endorsement
+    flags = plane_flags(utils.Plane._make(plane))
+    if not (flags[1] or flags[2]):
+        return False
 
-    else:
+    if instructor != None:
+        instructor = instructor_flags(utils.Instructor._make(instructor))
+
+    qualifications = pilots.audit_pilot(takeoff,student)
+    return check_endorsement(qualifications[2],qualifications[3],instructor,flags)
+
+
+def check_endorsement(student_advanced,student_multieng,instructor,flags):
+    """
+    Returns True if the student or instructor did not have the right endorsement.
+    
+    This is the same test as bad_endorsement, except that the endorsements of the student
+    at the time of takeoff (and the flags) have already been looked up.  This way
+    the lesson loop can look up the student once and share the answers between all of
+    the tests for a lesson.
+    
+    Parameter student_advanced: Whether the student has an advanced endorsement
+    Precondition: student_advanced is a bool
+    
+    Parameter student_multieng: Whether the student has a multiengine endorsement
+    Precondition: student_multieng is a bool
+    
+    Parameter instructor: The flags of the flight instructor
+    Precondition: instructor is None or a tuple returned by instructor_flags
+    
+    Parameter flags: The flags of the school airplane
+    Precondition: flags is a tuple returned by plane_flags
+    """
+    # Only advanced and multiengine planes need an endorsement
+    plane_advanced = flags[1]
+    plane_multieng = flags[2]
+    if not (plane_advanced or plane_multieng):
         return False
 
+    # With an instructor, only a multiengine plane needs more (an MEI)
+    if instructor != None:
+        return plane_multieng and not instructor[2]
+
+    # Alone, the student needs the endorsement for the plane.  A multiengine plane
+    # that is not also advanced is not checked, as in the original audit rules.
+    if plane_multieng:
+        return plane_advanced and not student_multieng
+    else:
+        return not student_advanced
+
 
 def bad_ifr(takeoff,student,instructor,plane):
     """
@@ -244,61 +230,122 @@ def bad_ifr(takeoff,student,instructor,plane):
     """
     assert type(takeoff) == datetime.datetime
 
-    # print('takeoff: ', takeoff,'/ takeoff_type: ', type(takeoff))
-    # print('student: ', student)
-    # print('instructor: ', instructor)
-    # print('plane: ', plane)
-    instructor_endorsed_multi = False
-    instructor_endorsed_advance = True
-    instructor_teaches_ifr = False
+    # Do not look up the student for a plane that cannot fly IFR at all
+    flags = plane_flags(utils.Plane._make(plane))
+    if not flags[0]:
+        return True
 
-    plane_ifr_capable = is_ifr_capable(plane)
-    plane_advanced = is_advanced(plane)
-    plane_multieng = is_multiengine(plane)
-    # print('plane_ifr_capable: ', plane_ifr_capable)
+    if instructor != None:
+        instructor = instructor_flags(utils.Instructor._make(instructor))
+
+    qualifications = pilots.audit_pilot(takeoff,student)
+    return check_ifr(qualifications[1],qualifications[2],qualifications[3],instructor,flags)
 
-    student_instrument_rated = pilots.has_instrument_rating(takeoff,student)
-    student_advanced = pilots.has_advanced_endorsement(takeoff,student)
-    student_multieng = pilots.has_multiengine_endorsement(takeoff,student)
 
-    # print('instructor: ', instructor)
+def check_ifr(student_instrument_rated,student_advanced,student_multieng,instructor,flags):
+    """
+    Returns True if the student, instructor, or plane is not certified for IFR.
+    
+    This is the same test as bad_ifr, except that the rating and endorsements of the 
+    student at the time of takeoff (and the flags) have already been looked up.  
+    This way the lesson loop can look up the student once and share the answers between
+    all of the tests for a lesson.
+    
+    Parameter student_instrument_rated: Whether the student has an instrument rating
+    Precondition: student_instrument_rated is a bool
+    
+    Parameter student_advanced: Whether the student has an advanced endorsement
+    Precondition: student_advanced is a bool
+    
+    Parameter student_multieng: Whether the student has a multiengine endorsement
+    Precondition: student_multieng is a bool
+    
+    Parameter instructor: The flags of the flight instructor
+    Precondition: instructor is None or a tuple returned by instructor_flags
+    
+    Parameter flags: The flags of the school airplane
+    Precondition: flags is a tuple returned by plane_flags
+    """
+    # A plane that is not outfitted for IFR fails no matter who flies it
+    if not flags[0]:
+        return True
+
+    plane_advanced = flags[1]
+    plane_multieng = flags[2]
+
     if instructor != None:
-        instructor_teaches_ifr = teaches_instrument(instructor)
-        instructor_multieng = teaches_multiengine(instructor)
+        instructor_teaches_ifr = instructor[1]
     else:
         instructor_teaches_ifr = False
-        instructor_multieng = False
-
-    # print('std endorsed_multi: ', student_multieng, ' / std endorsed_advance: ', \
-    #       student_advanced, 'std instrumnt rated: ', student_instrument_rated)
-    # print('inst endorsed_multi: ', instructor_endorsed_multi, ' / inst teaches_ifr: ', \
-    #     instructor_teaches_ifr )
 
-    if plane_ifr_capable == False:
+    if ((instructor == None) and plane_advanced and not student_advanced):
         return True
 
-    elif ((instructor == None) and (plane_ifr_capable == True) and (plane_advanced == True) and \
-        (student_advanced == False)):
+    elif ((instructor == None) and plane_multieng and not student_multieng):
         return True
 
-    elif ((instructor == None) and (plane_ifr_capable == True) and (plane_multieng == True) and \
-        (student_multieng == False)):
-        return True
-
-    elif ((instructor == None) and (plane_ifr_capable == True) and ((student_multieng == False) and \
-        (student_advanced == False) and (student_instrument_rated == False))):
+    elif ((instructor == None) and (not student_multieng and \
+        not student_advanced and not student_instrument_rated)):
         return True
         
-    elif ((instructor != None) and (plane_ifr_capable == True) and (instructor_teaches_ifr == False)):
+    elif ((instructor != None) and not instructor_teaches_ifr):
         return True
 
     else:
         return False
 
 
+def get_endorsement_violation(lesson,student,instructor,flags):
+    """
+    Returns a string representing the endorsement violation for this lesson, or the
+    empty string if there is none.
+    
+    The violation is 'SOLO' if the student files IFR alone without an instrument rating,
+    'Endorsement' if the student or instructor is not endorsed for the plane, and 'IFR'
+    for an IFR flight that the student, instructor, or plane is not certified for.  These
+    are checked in that order, and only the first one found is returned.
+    
+    Parameter lesson: The flight lesson
+    Precondition: lesson is a row of the lessons file (without the header)
+    
+    Parameter student: The student pilot
+    Precondition: student is 10-element list of strings representing a pilot
+    
+    Parameter instructor: The flags of the flight instructor
+    Precondition: instructor is None or a tuple returned by instructor_flags
+    
+    Parameter flags: The flags of the school airplane
+    Precondition: flags is a tuple returned by plane_flags
+    """
+    # Get the takeoff time
+    takeoff = utils.iso_to_time(lesson[3])
+
+    # Get lesson data (comparing the filed rules only once)
+    ifr_flight = lesson[5] == 'IFR'
+
+    # Check if the student is allowed to fly by themselves (looked up once per lesson)
+    qualifications = pilots.audit_pilot(takeoff,student)
+    student_instrument_rated = qualifications[1]
+    student_advanced = qualifications[2]
+    student_multieng = qualifications[3]
+
+    if (lesson[2] == '' and ifr_flight and not student_instrument_rated):
+        return 'SOLO'
+
+    # Check if pilot/instructor is endorsed for the plane
+    elif check_endorsement(student_advanced,student_multieng,instructor,flags):
+        return 'Endorsement'
+
+    # Check if pilot/instructor is permitted to fly IFR in this plane
+    elif ifr_flight and check_ifr(student_instrument_rated,student_advanced,
+                                  student_multieng,instructor,flags):
+        return 'IFR'
+
+    else:
+        return ''
+
+
 # FILENAMES
-# Sunrise and sunset (mainly useful for timezones, since repairs do not have them)
-DAYCYCLE = 'daycycle.json'
 # The list of all take-offs (and landings)
 LESSONS  = 'lessons.csv'
 # The list of all registered students in the flight school
@@ -307,8 +354,32 @@ STUDENTS = 'students.csv'
 TEACHERS = 'instructors.csv'
 # The list of all planes in the flight school
 PLANES   = 'fleet.csv'
-# The list of all repairs made to planes over the past year
-REPAIRS  = 'repairs.csv'
+
+# The contents of every CSV file loaded so far, keyed by file name.  Each value is the
+# pair [modification time, rows], so that a file is read again if it changes.
+_csv_cache = {}
+
+
+def load_csv(filename):
+    """
+    Returns the contents read from the CSV file filename, reading it only once.
+    
+    This is the same as utils.read_csv, except that the rows are cached.  If the file
+    has not been modified since it was last read, this function returns the same rows 
+    as before.  So the rows must not be modified by the caller.
+    
+    Parameter filename: The file to read
+    Precondition: filename is a string, referring to a file that exists, and that file
+    is a valid CSV file
+    """
+    modified = os.path.getmtime(filename)
+    cached = _csv_cache.get(filename)
+
+    if cached == None or cached[0] != modified:
+        cached = [modified, utils.read_csv(filename)]
+        _csv_cache[filename] = cached
+
+    return cached[1]
 
 
 def list_endorsement_violations(directory):
@@ -344,75 +415,36 @@ def list_endorsement_violations(directory):
     
     Parameter directory: The directory of files to audit
     Precondition: directory is the name of a directory containing the files
-    'daycycle.json', 'students.csv', 'instructors.csv', 'fleet.csv' and
-    'lessons.csv'
+    'students.csv', 'instructors.csv', 'fleet.csv' and 'lessons.csv'
     """
     # Load in all of the files
-    file_daycycle = utils.read_json(os.path.join(directory,DAYCYCLE))
-    file_lessons = utils.read_csv(os.path.join(directory,LESSONS))
-    file_students = utils.read_csv(os.path.join(directory,STUDENTS))
-    file_teachers = utils.read_csv(os.path.join(directory,TEACHERS))
-    file_planes = utils.read_csv(os.path.join(directory,PLANES))
-    file_repairs = utils.read_csv(os.path.join(directory,REPAIRS))
-    
-    
-    result = []
-    count = 0
-
-    # For each of the lessons
-    for lesson in file_lessons:
-        if count == 0:
-            pass
-        else:
-            # Get the takeoff time
-            takeoff = utils.str_to_time(lesson[3])
-
-            # Get lesson data
-            instructor = lesson[2]
-            area = lesson[6]
-
-            # Get student, plane, and instructor data
-            student_data = utils.get_for_id(lesson[0], file_students)
-            plane_data = utils.get_for_id(lesson[1], file_planes)
-            instructor_data = utils.get_for_id(lesson[2], file_teachers)
-
-            # Check if the student is allowed to fly by themselves
-            student_instrument_rated = pilots.has_instrument_rating(takeoff,student_data)
-            student_advanced = pilots.has_advanced_endorsement(takeoff,student_data)
-            student_multieng = pilots.has_multiengine_endorsement(takeoff,student_data)
-
-            # Check if pilot/instructor is endorsed for the plane
-            flight_not_endorsed = bad_endorsement(takeoff,student_data,instructor_data,plane_data)
-
-            # Check if pilot/instructor is permitted to fly IFR in this plane
-            flight_not_ifr_approved = bad_ifr(takeoff,student_data,instructor_data,plane_data)
-
-            if (instructor == '' and lesson[5] == 'IFR' and student_instrument_rated == False):
-                violation = 'SOLO'
-
-            elif (flight_not_endorsed == True):
-                violation = 'Endorsement' 
-
-            elif(lesson[5] == 'IFR' and flight_not_ifr_approved == True):
-                violation = 'IFR' 
-
-            else:
-                violation = ''
-
-            # if lesson[0] == 'S00526':
-            #     print('student: ', student_data)
-            #     print('teacher: ', instructor_data)
-            #     print('plane: ', plane_data)
-            #     print('lesson: ', lesson)
-            #     print('std endorsed_multi: ', student_multieng, ' / std endorsed_advance: ', \
-            #       student_advanced, 'std instrumnt rated: ', student_instrument_rated)
-            #     print('violation:', violation)
-
-            # Add any violations to the result
-            if (violation != ''):
-                lesson.append(violation)
-                result.append(lesson)
-
-        count += 1
+    file_lessons = load_csv(os.path.join(directory,LESSONS))
+    file_students = load_csv(os.path.join(directory,STUDENTS))
+    file_teachers = load_csv(os.path.join(directory,TEACHERS))
+    file_planes = load_csv(os.path.join(directory,PLANES))
+    
+    
+    # Index the students by id (instead of searching per lesson)
+    students_by_id = utils.index_by_id(file_students)
+
+    # The flags of each plane and instructor never change, so only compute them once
+    flags_by_teacher = {}
+    for row in file_teachers[1:]:
+        teacher = utils.Instructor._make(row)
+        if not teacher.id in flags_by_teacher:
+            flags_by_teacher[teacher.id] = instructor_flags(teacher)
+
+    flags_by_plane = {}
+    for row in file_planes[1:]:
+        plane = utils.Plane._make(row)
+        if not plane.tailno in flags_by_plane:
+            flags_by_plane[plane.tailno] = plane_flags(plane)
+
+    # Annotate a copy of each violating lesson (the rows are shared with the file cache)
+    result = [lesson + [violation] for lesson in file_lessons[1:]
+              if (violation := get_endorsement_violation(lesson,
+                                                         students_by_id.get(lesson[0]),
+                                                         flags_by_teacher.get(lesson[2]),
+                                                         flags_by_plane.get(lesson[1])))]
 
     return result
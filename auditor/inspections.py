@@ -52,81 +52,109 @@ Date: 08/19/2024
 """
 import os.path
 import datetime
+import logging
 import utils
 
+# Tracing for the lesson and repair loops (enable with logging.DEBUG)
+log = logging.getLogger(__name__)
+
 # FILENAMES
-# Sunrise and sunset (mainly useful for timezones, since repairs do not have them)
-DAYCYCLE = 'daycycle.json'
 # The list of all take-offs (and landings)
-#LESSONS  = 'lessons.csv'
-LESSONS  = 'lessons-mini.csv'
+LESSONS  = 'lessons.csv'
 # The list of all planes in the flight school
 PLANES   = 'fleet.csv'
 # The list of all repairs made to planes over the past year
 REPAIRS  = 'repairs.csv'
 
+# The number of seconds in a day and in an hour
+DAY_SECONDS  = 86400
+HOUR_SECONDS = 3600
+
+# VIOLATION CODES
+# Each check sets one bit (annual = 1, inspection = 2, grounded = 4) and the
+# resulting code is the position of the annotation in this tuple
+VIOLATIONS = ('', 'Annual', 'Inspection', 'Maintenance',
+              'Grounded', 'Maintenance', 'Maintenance', 'Maintenance')
+
 
-def get_repairs(plane, repairs, takeoff):
+def list_plane_violations(plane, lessons, repairs):
     """
-    Returns inspection records that occurred before the lesson takeoff time.
+    Returns a dictionary of the inspection violations for the lessons of one plane.
 
-    The inspections is the 2-dimensional list (table) of repairs, including the header.
-    The header for this table is as follows:
+    The keys of the dictionary are the lesson positions and the values are copies of
+    the violating lessons, with the annotation 'Annual', 'Inspection', 'Grounded' or
+    'Maintenance' appended (as described in list_inspection_violations).  Lessons
+    without a violation are not in the dictionary.
 
-        TAIL NO,IN DATE,OUT DATE,DESCRIPTION
+    Rather than searching every repair for every lesson, this function "interleaves"
+    the two.  The lessons are sorted by takeoff and the repairs are sorted by out date.
+    We then sweep through the lessons in order, moving a cursor forward through the
+    repairs as each one finishes.  Each repair is only processed once, so the work
+    is proportional to the number of lessons plus the number of repairs.  (Because
+    the takeoffs only move forward, this cursor does the job of a binary search for
+    the last repair before each takeoff, without the log factor.)
 
-    If there are no rows that match the parameters this function returns None.
+    This function only uses the data of a single plane and does not modify its
+    arguments, so the planes may be swept in any order (or independently).
+
+    The repair dates do not have a time zone.  They are compared against the local
+    (wall clock) time of each takeoff and landing, which is the same as giving the
+    repair the time zone of that lesson.  All of these times are in seconds, as
+    computed by utils.to_seconds.
 
     Parameter plane: The school airplane
-    Precondition: plane is a string representing an airplane id
+    Precondition: plane is a utils.Plane representing an airplane
 
-    Parameter repairs: The school airplane
-    Precondition: plane is a 4-element list of strings representing an airplane's repair history
+    Parameter lessons: The lessons flown in this plane
+    Precondition: lessons is a list of [takeoff, local takeoff, local landing, hours,
+    position, lesson] lists, where takeoff is a POSIX timestamp, the local takeoff and
+    landing are wall clock seconds, hours is a float, position is an int and lesson
+    is the row from the lessons file
 
-    Parameter takeoff: The takeoff time of this flight
-    Precondition: takeoff is a datetime object with a time zone
+    Parameter repairs: The repairs made to this plane
+    Precondition: repairs is a list of [in-date, out-date, description] lists, where
+    in-date and out-date are wall clock seconds
     """
-    # Find all rows that can apply to this plane
-    cert_time = '00:00'
-    count = 0
-    matches = []
-    print('======= Run get repair data =======')
-
-    for row in repairs:
-        print('row: ', row)
-        tail_id = row[0]
-        time_in = row[1] + "T" + cert_time
-        time_out = row[2] + "T" + cert_time
-        repair_description = row[3]
-
-        repair_in_date = utils.str_to_time(time_in,takeoff)
-        repair_out_date = utils.str_to_time(time_out,takeoff)
-
-        if tail_id == '684TM':
-            print('takeoff: ', takeoff)
-            print('time in: ', repair_in_date)
-            print('time out: ', repair_out_date)
-
-        if count > 0 and tail_id == '684TM':
-            print('plane id: ', plane, '/ tail_id', tail_id)
-            print('prev repair date: ', (repair_in_date < takeoff))
-
-        if count > 0 and (tail_id == plane) and (repair_in_date < takeoff):
-            print('### match found ###')
-            print('tail id: ', tail_id)
-            matches.append(row)
-            print('matches: ', matches)
-        else:
-            pass
-
-        count += 1
-
-    print('num matches: ', len(matches))
-    if len(matches) > 0:
-        return matches
-
-    else:
-        return None
+    last_annual = utils.to_seconds(datetime.datetime.fromisoformat(plane.annual))
+    hours = float(plane.hours)
+
+    lessons = sorted(lessons)
+    repairs = sorted(repairs, key=lambda repair: repair[1])
+
+    result = {}
+    current = 0
+    total = len(repairs)
+
+    for lesson in lessons:
+        local_takeoff = lesson[1]
+        local_landing = lesson[2]
+
+        # Apply every repair that finished before this takeoff (ANY repair resets hours)
+        while current < total and repairs[current][1] <= local_takeoff:
+            hours = 0.0
+            if repairs[current][2] == 'annual inspection':
+                last_annual = repairs[current][1]
+            current += 1
+
+        # The next unfinished repair grounds the plane if it starts before landing
+        grounded = current < total and repairs[current][0] < local_landing
+
+        hours = hours + lesson[3]
+        inspection = hours > 100
+        annual = local_takeoff - last_annual >= 366 * DAY_SECONDS    # More than 365 days
+
+        code = annual | (inspection << 1) | (grounded << 2)
+        if code:
+            violation = VIOLATIONS[code]
+            result[lesson[4]] = lesson[5] + [violation]
+
+            if __debug__ and log.isEnabledFor(logging.DEBUG):
+                log.debug('plane %s: %s at %s (%.1f hours, annual %.0f days ago)', plane.tailno,
+                          violation, lesson[5][3], hours,
+                          (local_takeoff - last_annual) // DAY_SECONDS)
+
+    return result
+
 
 def list_inspection_violations(directory):
     """
@@ -167,105 +195,54 @@ def list_inspection_violations(directory):
 
     Parameter directory: The directory of files to audit
     Precondition: directory is the name of a directory containing the files
-    'daycycle.json', 'fleet.csv', 'repairs.csv' and 'lessons.csv'
+    'fleet.csv', 'repairs.csv' and 'lessons.csv'
     """
     # Load in all of the files
-    file_daycycle = utils.read_json(os.path.join(directory,DAYCYCLE))
-    file_lessons = utils.read_csv(os.path.join(directory,LESSONS))
+    file_lessons = utils.iter_csv(os.path.join(directory,LESSONS))
     file_planes = utils.read_csv(os.path.join(directory,PLANES))
     file_repairs = utils.read_csv(os.path.join(directory,REPAIRS))
 
-    cert_time = '00:00'
-    violation = ''
-    last_repair_date = None
-    last_annual_repair_date = None
-
+    # Group the lessons by plane, remembering their position in the file
+    # (all timestamps are ISO formatted, so each one is parsed exactly once here)
+    lessons_by_plane = {}
+    next(file_lessons)          # Skip the header
+    for pos, lesson in enumerate(file_lessons,1):
+        takeoff = datetime.datetime.fromisoformat(lesson[3])
+        landing = datetime.datetime.fromisoformat(lesson[4])
+
+        # Compute everything the sweep needs up front, so it only compares and adds
+        takeoff_ts = takeoff.timestamp()
+        flown = (landing.timestamp() - takeoff_ts) / HOUR_SECONDS
+        local_takeoff = utils.to_seconds(takeoff)
+        local_landing = utils.to_seconds(landing)
+        entry = [takeoff_ts,local_takeoff,local_landing,flown,pos,lesson]
+        lessons_by_plane.setdefault(lesson[1],[]).append(entry)
+
+    # Group the repairs by plane
+    repairs_by_plane = {}
+    for repair in file_repairs[1:]:
+        repair_in = utils.to_seconds(datetime.datetime.fromisoformat(repair[1]))
+        repair_out = utils.to_seconds(datetime.datetime.fromisoformat(repair[2]))
+        repairs_by_plane.setdefault(repair[0],[]).append([repair_in,repair_out,repair[3]])
+
+    # Index the fleet by tail number
+    planes_by_id = {}
+    for row in file_planes[1:]:
+        plane = utils.Plane._make(row)
+        planes_by_id[plane.tailno] = plane
+
+    # Sweep through the lessons and repairs of each plane that has flown.
+    # The planes are independent, but a process pool is not worth it: the whole
+    # sweep is a few milliseconds, and __main__.py has no main guard for spawn.
+    found = {}
+    for tail_id in lessons_by_plane:
+        plane_repairs = repairs_by_plane.get(tail_id,[])
+        found.update(list_plane_violations(planes_by_id[tail_id],lessons_by_plane[tail_id],
+                                           plane_repairs))
+
+    # Add the violations to the result in the order of the lessons file
     result = []
-    count = 0
-
-    # For each of the lessons
-    for lesson in file_lessons:
-        print('lesson: ', lesson)
-        if count == 0:
-            pass
-        else:
-            # Get the takeoff and landing times
-            takeoff = utils.str_to_time(lesson[3])
-            landing = utils.str_to_time(lesson[4])
-            print('takeoff: ', takeoff)
-            print('landing: ', landing)
-
-            # Get plane and repair data using plane ID
-            plane_data = utils.get_for_id(lesson[1], file_planes)
-            print('plane_data: ', plane_data)
-            repair_data = get_repairs(plane_data[0], file_repairs, takeoff)
-            print('repair_data: ', repair_data, 'num recs: ', len(repair_data))
-
-        count += 1
+    for pos in sorted(found):
+        result.append(found[pos])
 
     return result
-"""
-            if len(repair_data) > 0:
-                for repair in repair_data:
-                    print('repair rec: ', repair)
-                    time_in = repair[1] + "T" + cert_time
-                    time_out = repair[2] + "T" + cert_time
-                    repair_description = repair[3]
-                    print('time in: ', time_in)
-                    print('time out: ', time_out)
-
-                    repair_in_date = utils.str_to_time(time_in,takeoff)
-                    repair_out_date = utils.str_to_time(time_out,takeoff)
-                    print('time in: ', repair_in_date)
-                    print('time out: ', repair_out_date)
-
-                    if last_repair_date == None:
-                        last_repair_date = repair_out_date
-                    elif repair_out_date > last_repair_date:
-                        last_repair_date = repair_out_date
-
-                    if repair_description == 'annual inspection' and last_annual_repair_date == None:
-                        last_annual_repair_date = repair_out_date
-                    elif repair_description == 'annual inspection' and last_annual_repair_date < repair_out_date:
-                        last_annual_repair_date = repair_out_date
-
-                    if (takeoff > repair_in_date) and (landing < repair_out_date):      # flight during maintenance
-                        violation = 'Grounded'
-
-                    elif (landing < repair_in_date):    # flight before maintenance
-                        time_since_last_repair_takeoff = takeoff - last_repair_date
-                        time_since_last_repair_landing = landing - last_repair_date
-                        print('time since last repair takeoff: ', time_since_last_repair_takeoff)
-                        print('time since last repair landing: ', time_since_last_repair_landing)
-
-                        if last_annual_repair_date != None:
-                            time_since_last_annual = takeoff - last_annual_repair_date
-                            print('time since last annual: ', time_since_last_annual)
-
-                        if time_since_last_repair_takeoff.seconds > 360000 or \
-                            time_since_last_repair_landing.seconds > 360000:
-                            violation = 'Inspection'
-
-                    elif (takeoff > repair_out_date):    # flight after maintenance
-                        pass
-
-                    # if (time_since_last_annual.days > 365):
-                    #     violation = 'Annual'
-
-            else:
-                violation = ''
-
-        # if lesson[0] == 'S00526':
-        #     print('student: ', student_data)
-        #     print('teacher: ', instructor_data)
-        #     print('plane: ', plane_data)
-        #     print('lesson: ', lesson)
-        #     print('std endorsed_multi: ', student_multieng, ' / std endorsed_advance: ', \
-        #       student_advanced, 'std instrumnt rated: ', student_instrument_rated)
-        #     print('violation:', violation)
-
-        # Add any violations to the result
-        if (violation != ''):
-            lesson.append(violation)
-            result.append(lesson)
-"""
@@ -39,8 +39,8 @@ Author: Mike Hermann
 Date: 08/12/2024
 """
 import utils
-import pytz
 import datetime
+import collections
 
 # CERTIFICATION CLASSIFICATIONS
 # The certification of this pilot is unknown
@@ -53,6 +53,116 @@ PILOT_STUDENT = 1
 PILOT_CERTIFIED = 2
 # A pilot that 50 hours post license
 PILOT_50_HOURS  = 3
+# The classifications of a pilot that has joined, in order of milestones reached
+CERTIFICATIONS  = (PILOT_NOVICE, PILOT_STUDENT, PILOT_CERTIFIED, PILOT_50_HOURS)
+
+# MINIMUMS MATCHING
+# The CATEGORY values of the minimums table that apply to each certification
+# (the category 'Dual' applies to any flight with an instructor)
+CATEGORY_MATCH = {
+    PILOT_INVALID:   frozenset(),
+    PILOT_NOVICE:    frozenset(),
+    PILOT_STUDENT:   frozenset({'Student'}),
+    PILOT_CERTIFIED: frozenset({'Student', 'Certified'}),
+    PILOT_50_HOURS:  frozenset({'Student', 'Certified', '50 Hours'})
+}
+# The flight areas that match each AREA value of the minimums table
+AREA_MATCH = {
+    'Pattern':       frozenset({'Pattern', 'Local', 'Any'}),
+    'Practice Area': frozenset({'Practice Area', 'Local', 'Any'}),
+    'Local':         frozenset({'Pattern', 'Practice Area', 'Local', 'Any'}),
+    'Cross Country': frozenset({'Cross Country', 'Any'}),
+    'Any':           frozenset({'Pattern', 'Practice Area', 'Local', 'Cross Country', 'Any'})
+}
+# Whether a CONDITIONS value applies to VFR (True) or IFR (False) flights
+CONDITION_CODES = {'VMC': True, 'IMC': False}
+# Whether a TIME value applies to day (True) or night (False) flights
+TIME_CODES = {'Day': True, 'Night': False}
+
+# The prepared table replaces the first four columns of a row with a single number, 
+# with one bit for each kind of flight (category, area, VFR, day) that the row applies
+# to.  So a row is matched with one AND instead of four separate comparisons.
+CATEGORIES = ('Student', 'Certified', '50 Hours', 'Dual')
+AREAS = ('Pattern', 'Practice Area', 'Local', 'Cross Country', 'Any')
+
+
+def _match_bit(category, area, vfr, daytime):
+    """
+    Returns the bit for a flight in the given category and area, under the given rules
+    and time of day (or 0 if any of these is unknown).
+    
+    Parameter category: The CATEGORY value
+    Precondition: category is a string
+    
+    Parameter area: The flight area
+    Precondition: area is a string
+    
+    Parameter vfr: Whether the flight is VFR (True) or IFR (False)
+    Precondition: vfr is a bool or None
+    
+    Parameter daytime: Whether the flight is during the day (True) or night (False)
+    Precondition: daytime is a bool or None
+    """
+    if not category in CATEGORIES or not area in AREAS or vfr == None or daytime == None:
+        return 0
+
+    pos = CATEGORIES.index(category)*len(AREAS) + AREAS.index(area)
+    return 1 << (pos*4 + vfr*2 + daytime)
+
+# The last minimums table given to get_minimums, followed by its prepared rows and
+# a dictionary of the answers found so far for that table
+_prepared_minimums = [None, None, None]
+
+# The dates that a pilot earned each qualification, as wall clock seconds (None if not
+# yet earned)
+PilotDates = collections.namedtuple('PilotDates',
+                                    'joined solo licensed hours50 instrument advanced multiengine')
+
+# The parsed dates of every pilot seen so far, keyed by the student row (as a tuple)
+_pilot_dates = {}
+
+
+def get_pilot_dates(student):
+    """
+    Returns the PilotDates for this student, parsing the date columns only once.
+    
+    Recall that a student is a 10-element list of strings.  The first three elements are
+    the student's identifier, last name, and first name.  The remaining seven elements
+    are the dates of joining the school, first solo, private license, 50 hours
+    certification, instrument rating, advanced endorsement, and multiengine endorsement.
+    
+    Each of these dates is converted to midnight at the start of that day, as an int
+    number of wall clock seconds computed by utils.to_seconds (empty or invalid columns
+    become None).  The result is cached, since an audit asks about the same pilot for
+    every one of their flights.  Comparing numbers is much cheaper than comparing
+    datetimes.
+    
+    To compare these dates to a takeoff, use utils.to_seconds(takeoff).  That is the
+    same as giving each date the time zone of the takeoff.
+    
+    Parameter student: The student pilot
+    Precondition: student is 10-element list of strings representing a pilot
+    """
+    key = tuple(student)
+    dates = _pilot_dates.get(key)
+
+    if dates == None:
+        values = []
+
+        for column in student[3:10]:
+            midnight = None
+            if column != '':
+                midnight = utils.date_to_midnight(column)
+
+            if midnight != None:
+                values.append(int(utils.to_seconds(midnight)))
+            else:
+                values.append(None)
+
+        dates = PilotDates._make(values)
+        _pilot_dates[key] = dates
+
+    return dates
 
 
 def get_certification(takeoff,student):
@@ -82,56 +192,91 @@ def get_certification(takeoff,student):
     assert type(takeoff) == datetime.datetime
     assert type(student) == list
 
-    cert_time = '00:00'
-
-    if student[3] != '':
-        time_joined = student[3] + "T" + cert_time
-        student_joined = utils.str_to_time(time_joined,takeoff)
-    else:
-        student_joined = None
+    return _classify(get_pilot_dates(student),utils.to_seconds(takeoff))
 
-    if student[4] != '':
-        time_solo = student[4] + "T" + cert_time
-        student_solo = utils.str_to_time(time_solo,takeoff)
-    else:
-        student_solo = None
 
-    if student[5] != '':
-        time_license = student[5] + "T" + cert_time
-        student_licensed = utils.str_to_time(time_license,takeoff)
-    else:
-        student_licensed = None
+def _classify(dates,local_takeoff):
+    """
+    Returns the certification classification for these dates at the time of takeoff.
+    
+    This does the work of get_certification, but only uses numbers, so that several
+    questions about the same flight can share one conversion of the takeoff.
+    
+    Parameter dates: The qualification dates of the student pilot
+    Precondition: dates is a PilotDates returned by get_pilot_dates
+    
+    Parameter local_takeoff: The takeoff time of this flight
+    Precondition: local_takeoff is a number of wall clock seconds (see utils.to_seconds)
+    """
+    if dates.joined == None:
+        return None
+    elif dates.joined > local_takeoff:
+        return PILOT_INVALID
 
+    # The classification is the last milestone reached before takeoff (not a count
+    # of milestones, since a pilot may be missing an earlier date in the records)
+    level = 0
+    milestones = (dates.solo, dates.licensed, dates.hours50)
+    for pos in range(len(milestones)):
+        if milestones[pos] != None and milestones[pos] < local_takeoff:
+            level = pos + 1
 
-    if student[6] != '':
-        time_50hours = student[6] + "T" + cert_time
-        student_50hours = utils.str_to_time(time_50hours,takeoff)
-    else:
-        student_50hours = None
+    return CERTIFICATIONS[level]
 
-    #student_instrument = utils.str_to_time(student[7])
-    #student_advanced = utils.str_to_time(student[8])
-    #student_multieng = utils.str_to_time(student[9])
 
-    if student_joined != None and student_joined <= takeoff:
-        result = PILOT_NOVICE
+def audit_pilot(takeoff,student):
+    """
+    Returns the tuple (certification, instrument, advanced, multiengine) for this 
+    student at the time of takeoff.
+    
+    The values are the results of get_certification, has_instrument_rating, 
+    has_advanced_endorsement, and has_multiengine_endorsement, in that order.  Use
+    this function when a flight needs all four answers.  It looks up the pilot and 
+    converts the takeoff once, instead of once per question.
+    
+    Parameter takeoff: The takeoff time of this flight
+    Precondition: takeoff is a datetime object with a time zone
+    
+    Parameter student: The student pilot
+    Precondition: student is 10-element list of strings representing a pilot
+    """
+    assert type(takeoff) == datetime.datetime
+    assert type(student) == list
 
-        if student_solo != None and student_solo < takeoff:
-            result = PILOT_STUDENT
+    dates = get_pilot_dates(student)
+    local_takeoff = utils.to_seconds(takeoff)
 
-        if student_licensed != None and student_licensed < takeoff:
-            result =  PILOT_CERTIFIED
+    instrument = dates.instrument != None and dates.instrument <= local_takeoff
+    advanced = dates.advanced != None and dates.advanced <= local_takeoff
+    multiengine = dates.multiengine != None and dates.multiengine <= local_takeoff
 
-        if student_50hours != None and student_50hours < takeoff:
-            result = PILOT_50_HOURS
+    return (_classify(dates,local_takeoff), instrument, advanced, multiengine)
 
-    elif student_joined != None and student_joined > takeoff:
-        result = PILOT_INVALID
 
-    else:
-        result = None
+def has_qualification(takeoff,student,field):
+    """
+    Returns True if the student has the given qualification at the time of takeoff, 
+    False otherwise
+    
+    The qualification is one of the fields of PilotDates, such as 'instrument', 
+    'advanced', or 'multiengine'.  A student has it at the time of takeoff if the date
+    it was earned is on or before the takeoff.  The functions has_instrument_rating, 
+    has_advanced_endorsement, and has_multiengine_endorsement all use this function.
+    
+    Parameter takeoff: The takeoff time of this flight
+    Precondition: takeoff is a datetime object
+    
+    Parameter student: The student pilot
+    Precondition: student is 10-element list of strings representing a pilot
+    
+    Parameter field: The qualification to check
+    Precondition: field is a string naming a field of PilotDates
+    """
+    assert type(takeoff) == datetime.datetime
+    assert type(student) == list
 
-    return result
+    earned = getattr(get_pilot_dates(student),field)
+    return earned != None and earned <= utils.to_seconds(takeoff)
 
 
 def has_instrument_rating(takeoff,student):
@@ -155,23 +300,7 @@ def has_instrument_rating(takeoff,student):
     Parameter student: The student pilot
     Precondition: student is 10-element list of strings representing a pilot
     """
-    assert type(takeoff) == datetime.datetime
-    assert type(student) == list
-
-    cert_time = '00:00'
-
-    if student[7] != '':
-        time_instrument = student[7] + "T" + cert_time
-        student_instrument = utils.str_to_time(time_instrument,takeoff)
-    else:
-        student_instrument = None
-
-
-    if student_instrument != None and student_instrument <= takeoff:
-        return True
-
-    else:
-        return False
+    return has_qualification(takeoff,student,'instrument')
 
 
 def has_advanced_endorsement(takeoff,student):
@@ -193,24 +322,7 @@ def has_advanced_endorsement(takeoff,student):
     Parameter student: The student pilot
     Precondition: student is 10-element list of strings representing a pilot
     """
-    assert type(takeoff) == datetime.datetime
-    assert type(student) == list
-
-    cert_time = '00:00'
-
-    #student_advanced = utils.str_to_time(student[8])
-    if student[8] != '':
-        time_advanced = student[8] + "T" + cert_time
-        student_advanced = utils.str_to_time(time_advanced,takeoff)
-    else:
-        student_advanced = None
-
-
-    if student_advanced != None and student_advanced <= takeoff:
-        return True
-
-    else:
-        return False
+    return has_qualification(takeoff,student,'advanced')
 
 
 def has_multiengine_endorsement(takeoff,student):
@@ -232,32 +344,16 @@ def has_multiengine_endorsement(takeoff,student):
     Parameter student: The student pilot
     Precondition: student is 10-element list of strings representing a pilot
     """
-    assert type(takeoff) == datetime.datetime
-    assert type(student) == list
-
-    cert_time = '00:00'
-
-    #student_multieng = utils.str_to_time(student[9])
-    if student[9] != '':
-        time_multieng = student[9] + "T" + cert_time
-        student_multieng = utils.str_to_time(time_multieng,takeoff)
-    else:
-        student_multieng = None
-
-
-    if student_multieng != None and student_multieng <= takeoff:
-        return True
-
-    else:
-        return False
+    return has_qualification(takeoff,student,'multiengine')
 
 
 def get_best_value(data, index, maximum=True):
     """
     Returns the 'best' value from a given column in a 2-dimensional nested list.
     
-    This function is a helper function for get_minimums (whose docstring you should
-    read and understand first). 
+    This function was written as a helper function for get_minimums (whose docstring
+    you should read and understand first).  get_minimums now finds all four best values
+    in a single pass over the table, but this function is still available on its own.
     
     The data parameter is a 2-dimensional nested list of data.  The index parameter
     indicates which "colummn" of data should be evaluated. Each item in that column
@@ -282,24 +378,46 @@ def get_best_value(data, index, maximum=True):
     assert type(index) == int
     assert type(data) == list
 
-    # Find the best values for each column of the row
-    best_value = 0.0
-    count = 0
+    # Find the best value in the column (0.0 if there are no rows)
+    if maximum:
+        return max((float(row[index]) for row in data), default=0.0)
+    else:
+        return min((float(row[index]) for row in data), default=0.0)
 
-    for row in data:
-        col_value = float(row[index])
-        if maximum == True and col_value > best_value:
-            best_value = col_value
 
-        if maximum == False:
-            if count == 0:
-                best_value = col_value
-            elif col_value < best_value:
-                best_value = col_value
+def prepare_minimums(minimums):
+    """
+    Returns the rows of the minimums table with the header removed and numbers converted.
+    
+    The minimums is the 2-dimensional list (table) of minimums, including the header,
+    as described in get_minimums.  This function returns a list with one tuple per row
+    (after the header).  Each tuple starts with a single int for the first four columns
+    (CATEGORY, CONDITIONS, AREA, and TIME).  This int has the bit from _match_bit set for
+    every kind of flight that the row applies to, and no others.  So a row with an 
+    unrecognized value is encoded as 0, which never matches.  This is followed by the 
+    four floats CEILING, VISIBILITY, WIND, and CROSSWIND.
+    
+    The table does not change during an audit, so get_minimums only calls this function
+    the first time it sees a table, and reuses the result for that same table after.
+    (As a result, a table should not be modified once it has been given to get_minimums.)
+    
+    Parameter minimums: The table of allowed minimums
+    Precondition: minimums is a 2d-list (table) as described in get_minimums, including
+    header
+    """
+    result = []
+
+    for row in minimums[1:]:
+        condition = CONDITION_CODES.get(row[1])
+        time = TIME_CODES.get(row[3])
 
-        count += 1
+        flights = 0
+        for area in AREA_MATCH.get(row[2],()):
+            flights = flights | _match_bit(row[0],area,condition,time)
 
-    return best_value
+        result.append((flights, float(row[4]), float(row[5]), float(row[6]), float(row[7])))
+
+    return result
 
 
 def get_minimums(cert, area, instructed, vfr, daytime, minimums):
@@ -386,8 +504,7 @@ def get_minimums(cert, area, instructed, vfr, daytime, minimums):
     Precondition: minimums is a 2d-list (table) as described above, including header
     """
     # Find all rows that can apply to this student
-    # Find the best values for each column of the row
-    # HINT: remember to use get_best_value to find best value in list of matches
+    # Find the best values for each column of the row (in the same pass)
     assert type(cert) == int
     assert type(area) == str
     assert type(instructed) == bool 
@@ -395,111 +512,63 @@ def get_minimums(cert, area, instructed, vfr, daytime, minimums):
     assert type(daytime) == bool
     assert type(minimums) == list
 
-    matches = []
-    cert_match = False
-    condition_match = False
-    area_match = False
-    time_match = False
-
-    for row in minimums:
-        mins_category = row[0]
-        mins_condition = row[1]
-        mins_area = row[2]
-        mins_time = row[3]
-
-        #ceiling = row[4]
-        #visibility = row[5]
-        #wind = row[6]
-        #xwind = row[7]
-
-        if mins_category == 'Student' and cert == PILOT_STUDENT:
-            cert_match = True
-        elif mins_category == 'Student' and cert == PILOT_CERTIFIED:
-            cert_match = True
-        elif mins_category == 'Student' and cert == PILOT_50_HOURS:
-            cert_match = True
-        elif mins_category == 'Certified' and cert == PILOT_CERTIFIED:
-            cert_match = True
-        elif mins_category == 'Certified' and cert == PILOT_50_HOURS:
-            cert_match = True
-        elif mins_category == '50 Hours' and cert == PILOT_50_HOURS:
-            cert_match = True
-        elif mins_category == 'Dual' and instructed == True:
-            cert_match = True
-        else:
-            cert_match = False
-
-
-        if mins_condition == 'VMC' and vfr == True:
-            condition_match = True
-        elif mins_condition == 'IMC' and vfr == False:
-            condition_match = True
-        else:
-            condition_match = False
-
-
-        if mins_area == 'Pattern' and area == 'Pattern':
-            area_match = True
-        elif mins_area == 'Pattern' and area == 'Local':
-            area_match = True
-        elif mins_area == 'Pattern' and area == 'Any':
-            area_match = True
-        elif mins_area == 'Practice Area' and area == 'Practice Area':
-            area_match = True
-        elif mins_area == 'Practice Area' and area == 'Local':
-            area_match = True
-        elif mins_area == 'Practice Area' and area == 'Any':
-            area_match = True
-        elif mins_area == 'Local' and area == 'Pattern':
-            area_match = True
-        elif mins_area == 'Local' and area == 'Practice Area':
-            area_match = True
-        elif mins_area == 'Local' and area == 'Local':
-            area_match = True
-        elif mins_area == 'Local' and area == 'Any':
-            area_match = True
-        elif mins_area == 'Cross Country' and area == 'Cross Country':
-            area_match = True
-        elif mins_area == 'Cross Country' and area == 'Any':
-            area_match = True
-        elif mins_area == 'Any' and area == 'Pattern':
-            area_match = True
-        elif mins_area == 'Any' and area == 'Practice Area':
-            area_match = True
-        elif mins_area == 'Any' and area == 'Local':
-            area_match = True
-        elif mins_area == 'Any' and area == 'Cross Country':
-             area_match = True
-        elif mins_area == 'Any' and area == 'Any':
-            area_match = True
-        else:
-            area_match = False
-
-
-        if mins_time == 'Day' and daytime == True:
-            time_match = True
-        elif mins_time == 'Night' and daytime == False:
-            time_match = True
-        else:
-            time_match = False            
-
-
-        if cert_match & condition_match & area_match & time_match:
-            matches.append(row)
-
-    best_minimums = []
-
-    if len(matches) > 0:
-        best_ceiling = get_best_value(matches, 4, maximum=False)
-        best_minimums.append(best_ceiling)
-        best_visibility = get_best_value(matches, 5, maximum=False)
-        best_minimums.append(best_visibility)
-        best_wind = get_best_value(matches, 6, maximum=True)
-        best_minimums.append(best_wind)
-        best_xwind = get_best_value(matches, 7, maximum=True)
-        best_minimums.append(best_xwind)
-
-        return best_minimums
+    # Convert the table once, the first time we see it
+    if _prepared_minimums[0] is not minimums:
+        _prepared_minimums[0] = minimums
+        _prepared_minimums[1] = prepare_minimums(minimums)
+        _prepared_minimums[2] = {}
+
+    # There are only a few dozen possible questions, so remember every answer
+    key = (cert, area, instructed, vfr, daytime)
+    answers = _prepared_minimums[2]
+    if not key in answers:
+        answers[key] = _find_minimums(cert, area, instructed, vfr, daytime,
+                                      _prepared_minimums[1])
+
+    # Return a copy, so the caller cannot change the remembered answer
+    if answers[key] == None:
+        return None
+    else:
+        return list(answers[key])
+
+
+def _find_minimums(cert, area, instructed, vfr, daytime, rows):
+    """
+    Returns the most advantageous minimums for the given flight category.
+    
+    This function does the work of get_minimums (see that function for the details of
+    the parameters and the result), but searches a table that has already been
+    converted by prepare_minimums.
+    
+    Parameter rows: The prepared table of allowed minimums
+    Precondition: rows is a list of tuples returned by prepare_minimums
+    """
+    # Mark every kind of flight this one counts as (one for each category)
+    categories = CATEGORY_MATCH.get(cert,frozenset())
+    if instructed:
+        categories = categories | {'Dual'}
+
+    wanted = 0
+    for category in categories:
+        wanted = wanted | _match_bit(category,area,vfr,daytime)
+
+    # Find the best values as we go, in a single pass
+    found = False
+    best_ceiling = float('inf')
+    best_visibility = float('inf')
+    best_wind = float('-inf')
+    best_xwind = float('-inf')
+
+    for (flights, ceiling, visibility, wind, xwind) in rows:
+        if flights & wanted:
+            found = True
+            best_ceiling = min(best_ceiling, ceiling)
+            best_visibility = min(best_visibility, visibility)
+            best_wind = max(best_wind, wind)
+            best_xwind = max(best_xwind, xwind)
+
+    if found:
+        return [best_ceiling, best_visibility, best_wind, best_xwind]
     else:
         return None
 
@@ -16,8 +16,20 @@ Date: 08/12/2024
 from dateutil.parser import parse
 import csv
 import json
-import pytz
+from zoneinfo import ZoneInfo
 import datetime
+import functools
+import collections
+
+
+# A row of fleet.csv, so that the columns can be accessed by name (or by position)
+Plane = collections.namedtuple('Plane',
+                               'tailno type capability advanced multiengine annual hours')
+# A row of instructors.csv, so that the columns can be accessed by name (or by position)
+Instructor = collections.namedtuple('Instructor','id lastname firstname cfi cfii mei')
+
+# The start of the wall clock used by to_seconds
+EPOCH = datetime.datetime(1970,1,1)
 
 
 def read_csv(filename):
@@ -46,6 +58,23 @@ def read_csv(filename):
     return fileout
 
 
+def iter_csv(filename):
+    """
+    Yields the rows of the CSV file filename, one at a time.
+    
+    This function is a streaming version of read_csv.  Rather than building the whole
+    2-dimensional list in memory, it reads the file in order and produces each row
+    (including the header, which is first) as a list of strings.  Use this for large
+    files that only need to be processed once from start to finish.
+    
+    Parameter filename: The file to read
+    Precondition: filename is a string, referring to a file that exists, and that file 
+    is a valid CSV file
+    """
+    with open(filename, newline='') as infile:
+        yield from csv.reader(infile)
+
+
 def write_csv(data,filename):
     """
     Writes the given data out as a CSV file filename.
@@ -56,19 +85,16 @@ def write_csv(data,filename):
     representation.
     
     Parameter data: The Python value to encode as a CSV file
-    Precondition: data is a  2-dimensional list of strings
+    Precondition: data is a  2-dimensional list of strings (or any iterable of rows)
     
     Parameter filename: The file to read
     Precondition: filename is a string representing a path to a file with extension
     .csv or .CSV.  The file may or may not exist.
     """
-    infile = open(filename, 'w')
-    csvout = csv.writer(infile)
-
-    for row in data:
-        csvout.writerow(row)
-
-    infile.close()
+    # A large buffer lets the rows go out in a few big writes instead of many small ones
+    with open(filename, 'w', newline='', buffering=1<<20) as outfile:
+        csvout = csv.writer(outfile)
+        csvout.writerows(data)
 
 
 def read_json(filename):
@@ -83,14 +109,31 @@ def read_json(filename):
     Precondition: filename is a string, referring to a file that exists, and that file 
     is a valid JSON file
     """
-    file = open(filename, 'r')
-    data = file.read()
+    # The json module decodes the raw bytes itself, which skips the text layer of open
+    with open(filename, 'rb') as file:
+        data = file.read()
 
-    result = json.loads(data)
+    return json.loads(data)
 
-    file.close()
 
-    return result
+@functools.lru_cache(maxsize=None)
+def _parse_timestamp(timestamp):
+    """
+    Returns the datetime object for the given timestamp (or None if timestamp is 
+    invalid), without any time zone handling.
+    
+    This is the slow part of str_to_time, so the results are cached.  The same few
+    thousand timestamps (certification dates, weather keys) are converted over and
+    over during an audit.  Datetime objects are immutable, so sharing them is safe,
+    and parsed time zones are shared along with them.
+    
+    Parameter timestamp: The time stamp to convert
+    Precondition: timestamp is a string
+    """
+    try:
+        return parse(timestamp)
+    except:
+        return None
 
 
 def str_to_time(timestamp,tzsource=None):
@@ -120,11 +163,10 @@ def str_to_time(timestamp,tzsource=None):
     or a datetime object.
     """
     # HINT: Use the code from the previous exercise and add time zone handling.
-    # Use localize if tzsource is a string; otherwise replace the time zone if not None
+    # Use a ZoneInfo if tzsource is a string; otherwise replace the time zone if not None
 
-    try:
-        timestamp_dt = parse(timestamp)
-    except:
+    timestamp_dt = _parse_timestamp(timestamp)
+    if timestamp_dt == None:
         return None
 
     if type(tzsource) == datetime.datetime and timestamp_dt.tzinfo == None:
@@ -132,13 +174,99 @@ def str_to_time(timestamp,tzsource=None):
         return new_dt
 
     elif type(tzsource) == str and timestamp_dt.tzinfo == None:
-        tz = pytz.timezone(tzsource)
-        return tz.localize(timestamp_dt)
+        # ZoneInfo works out daylight saving time from the wall clock (unlike pytz,
+        # there is no localize step), and the stdlib caches the zone objects
+        return timestamp_dt.replace(tzinfo=ZoneInfo(tzsource))
     
     else:
         return timestamp_dt
 
 
+def iso_to_time(timestamp):
+    """
+    Returns the datetime object for the given timestamp (or None if timestamp is 
+    invalid).
+    
+    This is a fast path for str_to_time(timestamp) when the timestamp is in ISO format,
+    like the takeoffs and landings '2017-01-02T11:00:00-05:00' in the lessons file.  It 
+    uses the built-in datetime.fromisoformat instead of the (much slower) general dateutil
+    parser.  Any other format falls back to str_to_time.
+    
+    Parameter timestamp: The time stamp to convert
+    Precondition: timestamp is a string
+    """
+    try:
+        return datetime.datetime.fromisoformat(timestamp)
+    except ValueError:
+        return str_to_time(timestamp)
+
+
+def date_to_midnight(datestr,tzsource=None):
+    """
+    Returns the datetime object for midnight at the start of the given date (or None
+    if datestr is invalid).
+    
+    This is a fast path for str_to_time(datestr + 'T00:00', tzsource) when datestr is
+    an ISO date like '2017-01-22'.  It builds the datetime directly with the built-in 
+    date.fromisoformat instead of the (much slower) general dateutil parser.  Any other
+    format falls back to str_to_time.
+    
+    If tzsource is a datetime object, the result gets the same time zone as tzsource.
+    Otherwise the result has no time zone.
+    
+    Parameter datestr: The date to convert
+    Precondition: datestr is a string
+    
+    Parameter tzsource: The time zone to use (OPTIONAL)
+    Precondition: tzsource is either None or a datetime object
+    """
+    if tzsource == None:
+        return _midnight(datestr,None)
+    else:
+        return _midnight(datestr,tzsource.tzinfo)
+
+
+@functools.lru_cache(maxsize=4096)
+def _midnight(datestr,tzinfo):
+    """
+    Returns the datetime object for midnight at the start of the given date, in the
+    time zone tzinfo (or None if datestr is invalid).
+    
+    This does the work of date_to_midnight.  Many pilots share the same dates (a class
+    that soloed on the same day), so the results are cached by date and time zone.
+    
+    Parameter datestr: The date to convert
+    Precondition: datestr is a string
+    
+    Parameter tzinfo: The time zone to use
+    Precondition: tzinfo is None or a tzinfo object
+    """
+    try:
+        day = datetime.date.fromisoformat(datestr)
+    except ValueError:
+        timestamp_dt = _parse_timestamp(datestr + 'T00:00')
+        if timestamp_dt == None or timestamp_dt.tzinfo != None or tzinfo == None:
+            return timestamp_dt
+        return timestamp_dt.replace(tzinfo=tzinfo)
+
+    return datetime.datetime.combine(day, datetime.time.min, tzinfo=tzinfo)
+
+
+def to_seconds(time):
+    """
+    Returns the wall clock time of time as a number of seconds since 1970-01-01.
+
+    Any time zone on time is ignored, so a takeoff and a date (with no time zone) line
+    up no matter what the offset is.  This is the same as giving the date the time zone
+    of the takeoff.  Numbers are much cheaper to compare and subtract than datetime
+    objects, which matters when the same dates are checked for every flight.
+
+    Parameter time: The time to convert
+    Precondition: time is a datetime object
+    """
+    return (time.replace(tzinfo=None) - EPOCH).total_seconds()
+
+
 def daytime(time,daycycle):
     """
     Returns true if the time takes place during the day.
@@ -228,3 +356,22 @@ def get_for_id(id,table):
     for row in table:
         if row[0] == id:
             return row
+
+
+def index_by_id(table):
+    """
+    Returns a dictionary of the rows of table (after the header), keyed by their id.
+    
+    This is the same lookup as get_for_id, but each search is a single dictionary 
+    access instead of a scan of the whole table.  Build the index once, before looping
+    over the lessons.  As with get_for_id, the first row with an id wins, and an id 
+    that is not in the table gives None (with the dictionary method get).
+    
+    Parameter table: The 2-dimensional table of data, including the header
+    Precondition: table is a non-empty 2-dimension list of strings
+    """
+    result = {}
+    for row in table[1:]:
+        if not row[0] in result:
+            result[row[0]] = row
+    return result
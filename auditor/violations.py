@@ -34,7 +34,24 @@ Date: 08/14/2024
 import utils
 import pilots
 import os.path
-import datetime
+import bisect
+
+# The last weather dictionary given to get_weather_report, followed by its index
+# (see index_weather)
+_weather_index = [None, None]
+
+
+# VIOLATION CODES
+# Each weather problem sets one bit (ceiling = 1, winds = 2, visibility = 4) and the
+# resulting code is the position of the violation in this tuple
+VIOLATIONS = ('', 'Ceiling', 'Winds', 'Weather',
+              'Visibility', 'Weather', 'Weather', 'Weather')
+
+# The cloud layers that do not form a ceiling (any other type is a solid layer)
+OPEN_LAYERS = frozenset({'a few', 'scattered'})
+
+# The key added to each loaded weather report for its lowest ceiling (see lowest_ceiling)
+CEILING_KEY = '_lowest_ceiling'
 
 
 # WEATHER FUNCTIONS
@@ -75,30 +92,14 @@ def bad_visibility(visibility,minimum):
     
     if visibility == 'unavailable':
         return True
-    else:
-
-        unit = visibility['units']
-        if 'minimum' in visibility:
-            min_visibility = visibility['minimum']
-
-            if unit == 'FT':           # Convert to miles
-                min_visibility = min_visibility / 5280.0
 
-            if min_visibility < minimum:
-                return True
-            else:
-                return False
+    # Use the minimum if there is one, and the prevailing visibility otherwise
+    measurement = visibility.get('minimum',visibility.get('prevailing'))
+    if measurement == None:     # Not a valid measurement
+        return None
 
-        elif 'prevailing' in visibility:
-            prev_visibility = visibility['prevailing']
-
-            if unit == 'FT':           # Convert to miles
-                prev_visibility = prev_visibility / 5280.0
-
-            if prev_visibility < minimum:
-                return True
-            else:
-                return False
+    divisor = 5280.0 if visibility['units'] == 'FT' else 1.0     # Convert to miles
+    return measurement / divisor < minimum
 
 
 def bad_winds(winds,maxwind,maxcross):
@@ -144,57 +145,19 @@ def bad_winds(winds,maxwind,maxcross):
     Precondition: maxcross is a float or int
     """
 
-    wind_speed = 0.0
-    wind_gust = 0.0
-    cross_wind = 0.0
-    high_speed = False
-    high_xwind = False
-
     if winds == 'calm':
         return False
 
-    elif winds == 'unavailable':
+    if winds == 'unavailable':
         return True
 
-    else:
-        unit = winds['units']
-        if 'speed' in winds:
-            wind_speed = winds['speed']
-            if unit == 'MPS':           # Convert to knots
-                wind_speed = wind_speed * 1.94384
-
-        if 'gusts' in winds:
-            wind_gust = winds['gusts']
-            if unit == 'MPS':           # Convert to knots
-                wind_gust = wind_gust * 1.94384
-
-        if wind_speed > wind_gust:
-            if wind_speed > maxwind:
-                high_speed = True
-            else:
-                high_speed = False
-
-        else:
-            if wind_gust > maxwind:
-                high_speed = True
-            else:
-                high_speed = False
-
-        if 'crosswind' in winds:
-            cross_wind = winds['crosswind']
+    scale = 1.94384 if winds['units'] == 'MPS' else 1.0      # Convert to knots
 
-            if unit == 'MPS':           # Convert to knots
-                cross_wind = cross_wind * 1.94384
-
-            if cross_wind > maxcross:
-                high_xwind = True
-            else:
-                high_xwind = False
-
-    if high_speed or high_xwind:
+    # Compare the worse of the speed and gusts first
+    if max(winds.get('speed',0.0),winds.get('gusts',0.0)) * scale > maxwind:
         return True
-    else:
-        return False
+
+    return 'crosswind' in winds and winds['crosswind'] * scale > maxcross
 
 
 def bad_ceiling(ceiling,minimum):
@@ -239,37 +202,41 @@ def bad_ceiling(ceiling,minimum):
     Parameter minimum: The minimum allowed ceiling (in feet)
     Precondition: minimum is a float or int
     """
-    height = 0.0
+    return lowest_ceiling(ceiling) < minimum
+
 
+def lowest_ceiling(ceiling):
+    """
+    Returns the height (in feet) of the lowest solid cloud layer in the ceiling.
+    
+    The ceiling is a ceiling measurement, as described in bad_ceiling.  A solid layer is
+    one that is 'broken', 'overcast', or 'indefinite ceiling'.  If the ceiling is 'clear',
+    or it only has 'a few' or 'scattered' layers, this function returns infinity (so no
+    minimum is violated).  If the ceiling is 'unavailable', it returns negative infinity
+    (so every minimum is violated).  Hence bad_ceiling(ceiling,minimum) is the same as
+    lowest_ceiling(ceiling) < minimum.
+    
+    The weather does not change during an audit, so list_weather_violations computes
+    this once for each weather report, and only compares the result after.
+    
+    Parameter ceiling: The ceiling information
+    Precondition: ceiling is a valid ceiling measurement, as described in bad_ceiling
+    """
     if ceiling == 'clear':
-        return False
+        return float('inf')
 
     if ceiling == 'unavailable':
-        return True
+        return float('-inf')
 
-    if len(ceiling) == 1:
-        if ((ceiling[0]['type'] == 'a few') or (ceiling[0]['type'] == 'scattered')):
-            return False
+    result = float('inf')
+    for cover in ceiling:
+        if not cover['type'] in OPEN_LAYERS and cover['height'] < result:
+            result = cover['height']
 
-        else:
-            if ceiling[0]['height'] < minimum:
-                return True
-            
-            else:
-                return False
-
-    else:
-        for cover in ceiling:
-            height = cover['height']
-
-            if ((cover['type'] != 'a few') and (cover['type'] != 'scattered')):
-                if height < minimum:
-                    return True
-
-        return False    
+    return result
 
 
-def get_weather_report(takeoff,weather):
+def get_weather_report(takeoff,weather,index=None):
     """
     Returns the most recent weather report at or before take-off.
     
@@ -330,8 +297,9 @@ def get_weather_report(takeoff,weather):
     
     If there is a report whose timestamp matches the ISO representation of takeoff, 
     this function uses that report.  Otherwise it searches the dictionary for the most
-    recent report before (but not equal to) takeoff.  If there is no such report, it
-    returns None.
+    recent report before (but not equal to) takeoff, on the same day as takeoff.  The
+    times are compared on the wall clock, to the second.  If there is no such report, 
+    it returns None.
     
     Example: If takeoff was as 8 am on April 21, 2017 (Eastern), this function returns 
     the value for key '2017-04-21T08:00:00-04:00'.  If there is no additional report at
@@ -342,55 +310,71 @@ def get_weather_report(takeoff,weather):
     
     Paramater weather: The weather report dictionary 
     Precondition: weather is a dictionary formatted as described above
+    
+    Parameter index: The reports of weather by day (OPTIONAL)
+    Precondition: index is None or the result of index_weather(weather)
     """
     # HINT: Looping through the dictionary is VERY slow because it is so large
     # You should convert the takeoff time to an ISO string and search for that first.
     # Only loop through the dictionary as a back-up if that fails.
     
     # Search for time in dictionary
-    # As fall back, find the closest time before takeoff
-    takeoff_weather = None
-    close_key = None
-    current_diff = datetime.timedelta(seconds=0)
     str_takeoff = takeoff.isoformat()
-    #print('takeoff date: ', str_takeoff, 'take off time zone: ', takeoff.tzinfo)
+    takeoff_weather = weather.get(str_takeoff)
+    if takeoff_weather != None:
+        return takeoff_weather
 
-    try:
-        takeoff_weather = weather[str_takeoff]
-        #print('takeoff weather: ', takeoff_weather)
+    # As fall back, find the closest time before takeoff (on the same day).  Instead of
+    # looping through the dictionary, search the sorted times of that day.
+    if index == None:
+        if _weather_index[0] is not weather:
+            _weather_index[0] = weather
+            _weather_index[1] = index_weather(weather)
+        index = _weather_index[1]
 
-        return takeoff_weather
+    day = index.get(str_takeoff[:10])
+    if day == None:
+        return None
 
-    except:
-        #print('take off weather not found with exact key')
-        pass
+    # The last report strictly before the takeoff (to the second) on the wall clock
+    pos = bisect.bisect_left(day[0],str_takeoff[:19]) - 1
+    if pos < 0:
+        return None
 
-    takeoff_date = takeoff.strftime("%Y-%m-%d")
-    #if str_takeoff == '2017-03-12T03:00:00-05:00':
-    #    print('take off date: ', takeoff_date)
-       
-    for key in weather:
-        key_date = utils.str_to_time(key)
-        key_day = utils.str_to_time(key).strftime("%Y-%m-%d")
+    return weather[day[1][pos]]
 
-        if key_day == takeoff_date:
-            takeoff_tz = takeoff.replace(tzinfo=key_date.tzinfo)
-            #if str_takeoff == '2017-03-12T03:00:00-05:00':
-            #   print('key_date: ', key_date, 'key date time zone: ', key_date.tzinfo)
-            #   print('new takeoff time: ', takeoff_tz, 'time zone: ', takeoff_tz.tzinfo)
 
-            date_diff = takeoff_tz - key_date
-            #if str_takeoff == '2017-03-12T03:00:00-05:00':
-            #    print('date diff days: ', date_diff.days, 'date diff sec: ', date_diff.seconds)
+def index_weather(weather):
+    """
+    Returns a dictionary of the weather reports of each day, sorted by time.
+    
+    The weather is a dictionary of weather reports, as described in get_weather_report.
+    The keys of the result are dates 'YYYY-MM-DD'.  The value for a date is a pair of
+    lists (times, keys).  The value times is the sorted list of wall clock times 
+    'YYYY-MM-DDTHH:MM:SS' of the reports on that day, and keys is the list of the 
+    matching keys of weather, in the same order.  Reports with the same wall clock time
+    (such as when the clocks fall back) stay in the order of the weather dictionary.
+    
+    ISO timestamps sort in time order as strings, so no timestamps are parsed.  The
+    weather does not change during an audit, so list_weather_violations calls this
+    function once and passes the result to get_weather_report.  Without an index, 
+    get_weather_report calls this function the first time it sees a weather dictionary,
+    and reuses the result after.  (As a result, a weather dictionary should not be 
+    modified once it has been given to get_weather_report.)
+    
+    Paramater weather: The weather report dictionary 
+    Precondition: weather is a dictionary formatted as described in get_weather_report
+    """
+    entries = {}
+    for pos, key in enumerate(weather):
+        entries.setdefault(key[:10],[]).append((key[:19],pos,key))
 
-            if date_diff.days >= 0 and date_diff.seconds > 0:
-                if close_key == None or (date_diff <= current_diff):
-                    current_diff = date_diff
-                    close_key = key
-                    #print('close key: ', close_key, 'close code: ', weather[close_key]['code'])
+    result = {}
+    for date in entries:
+        ordered = sorted(entries[date])
+        result[date] = ([entry[0] for entry in ordered], [entry[2] for entry in ordered])
 
-    takeoff_weather = weather[close_key]
-    return takeoff_weather
+    return result
 
 
 def get_weather_violation(weather,minimums):
@@ -444,6 +428,9 @@ def get_weather_violation(weather,minimums):
     available (e.g. weather is None).  Finally, it returns '' (the empty string) if 
     the weather is fine and there are no violations.
     
+    If the weather reading has the key CEILING_KEY (added by list_weather_violations),
+    its lowest ceiling is compared against the minimum instead of calling bad_ceiling.
+    
     Parameter weather: The weather measure
     Precondition: weather is dictionary containing a visibility, wind, and ceiling measurement,
     or None if no weather reading is available.
@@ -466,22 +453,17 @@ def get_weather_violation(weather,minimums):
 
     visibility_violation = bad_visibility(visibility,min_visibility)
     wind_violation = bad_winds(winds,max_windspeed,max_xwinds)
-    ceiling_violation = bad_ceiling(ceiling,min_ceiling)
-
-    if visibility_violation == False and wind_violation == False and ceiling_violation == False:
-        return ''
-
-    elif visibility_violation == True and wind_violation == False and ceiling_violation == False:
-        return 'Visibility'
-    
-    elif visibility_violation == False and wind_violation == True and ceiling_violation == False:
-        return 'Winds'
-
-    elif visibility_violation == False and wind_violation == False and ceiling_violation == True:
-        return 'Ceiling'
-
+    # Use the lowest ceiling from list_weather_violations if it was computed already
+    height = weather.get(CEILING_KEY)
+    if height == None:
+        ceiling_violation = bad_ceiling(ceiling,min_ceiling)
     else:
-        return 'Weather'
+        ceiling_violation = height < min_ceiling
+
+    # Each problem sets one bit, and the code is the position of the answer in VIOLATIONS
+    code = bool(ceiling_violation) | (bool(wind_violation) << 1)
+    code = code | (bool(visibility_violation) << 2)
+    return VIOLATIONS[code]
 
 
 # FILES TO AUDIT
@@ -542,57 +524,68 @@ def list_weather_violations(directory):
     file_students = utils.read_csv(os.path.join(directory,STUDENTS))
     file_lessons = utils.read_csv(os.path.join(directory,LESSONS))
     
-    result = []
-    count = 0
+    # Index the students by id (instead of searching per lesson)
+    students_by_id = utils.index_by_id(file_students)
 
-    # For each of the lessons
-    for lesson in file_lessons:
-        if count == 0:
-            pass
-        else:
-            # Get the takeoff time
-            takeoff = utils.str_to_time(lesson[3])
-
-            # Get lesson data
-            instructor = lesson[2]
-            area = lesson[6]
-
-            if lesson[5] == 'VFR':
-                filed = True
-            else:
-                filed = False
-
-            if (instructor == ''):
-                instructed = False
-            else:
-                instructed = True 
+    # Sort the weather reports of each day once, before looping over the lessons
+    weather_index = index_weather(file_weather)
 
-            # Get the pilot credentials
-            student_data = utils.get_for_id(lesson[0], file_students)
-            student_cert = pilots.get_certification(takeoff,student_data)
-            #print('student_data: ', student_data)
-            #print('student_cert: ', student_cert)
+    # Find the lowest ceiling of each report once (so each check is a single compare)
+    for key in file_weather:
+        report = file_weather[key]
+        report[CEILING_KEY] = lowest_ceiling(report['sky'])
 
-            day_flight = utils.daytime(takeoff,file_daycycle)
-            #print('daytime: ', day_flight)
+    # The minimums of each kind of flight seen so far (these are only read, never changed)
+    mins_cache = {}
 
-            # Get the pilot minimums
-            student_mins = pilots.get_minimums(student_cert, area, instructed, filed, day_flight, file_minimums)
-            #print('student_mins: ', student_mins)
+    result = []
 
-            # Get the weather conditions
-            flight_weather = get_weather_report(takeoff,file_weather)
-            #print('weather elements: ', len(flight_weather))
+    # For each of the lessons (skipping the header)
+    for lesson in file_lessons[1:]:
+        # Get the takeoff time (ISO formatted, so this skips the slow general parser)
+        takeoff = utils.iso_to_time(lesson[3])
 
-            # Check for a violation and add to result if so
-            violation = get_weather_violation(flight_weather,student_mins)
-            #print('violation: ', violation)
+        # Get lesson data
+        instructor = lesson[2]
+        area = lesson[6]
 
-            if (violation != '') and (violation != 'Unknown') and (violation != None):
-                lesson.append(violation)
-                result.append(lesson)
+        if lesson[5] == 'VFR':
+            filed = True
+        else:
+            filed = False
 
-        count += 1
+        if (instructor == ''):
+            instructed = False
+        else:
+            instructed = True 
+
+        # Get the pilot credentials
+        student_data = students_by_id.get(lesson[0])
+        student_cert = pilots.get_certification(takeoff,student_data)
+        #print('student_data: ', student_data)
+        #print('student_cert: ', student_cert)
+
+        day_flight = utils.daytime(takeoff,file_daycycle)
+        #print('daytime: ', day_flight)
+
+        # Get the pilot minimums (only once for each kind of flight)
+        mins_key = (student_cert, area, instructed, filed, day_flight)
+        if not mins_key in mins_cache:
+            mins_cache[mins_key] = pilots.get_minimums(student_cert, area, instructed, filed,
+                                                       day_flight, file_minimums)
+        student_mins = mins_cache[mins_key]
+        #print('student_mins: ', student_mins)
+
+        # Get the weather conditions
+        flight_weather = get_weather_report(takeoff,file_weather,weather_index)
+        #print('weather elements: ', len(flight_weather))
+
+        # Check for a violation and add to result if so
+        violation = get_weather_violation(flight_weather,student_mins)
+        #print('violation: ', violation)
+
+        if violation and (violation != 'Unknown'):
+            result.append(lesson + [violation])
 
     return result
 